@@ -1,101 +1,429 @@
 # app.py — AlphaOps CME Sandbox (Extended RSI + CVD)
-import os, json
+import os, re, sys, asyncio, calendar, fcntl, hmac
+from collections import Counter
 from datetime import datetime, timezone
-from typing import Any, Dict, Optional
-from fastapi import FastAPI, Request, HTTPException
-import aiofiles, httpx
-from supabase import create_client, Client
+from typing import Any, Dict, List, Optional, Tuple
+from fastapi import FastAPI, Request, HTTPException, BackgroundTasks
+from fastapi.responses import ORJSONResponse, Response
+import httpx, msgspec
 
 # ───────────────────────────────────────────────
 # Environment
 APP_SECRET = os.getenv("ALPHAOPS_SECRET", "")
 RELAXED_AUTH = os.getenv("RELAXED_AUTH", "0").lower() in ("1","true","yes")
 DISCORD_WEBHOOK = os.getenv("DISCORD_WEBHOOK_STATUS", "")
+LOG_ENABLED = os.getenv("LOG_ENABLED", "1").lower() in ("1","true","yes")
 LOG_PATH = os.getenv("LOG_PATH", "/mnt/data/cme_sandbox.json")
+LOG_DIR = os.path.dirname(LOG_PATH)
+# with several uvicorn workers (WEB_CONCURRENCY > 1) each one appends to its own
+# <LOG_PATH stem>.<slot><ext>, slot 0..N-1, rather than sharing one file: O_APPEND isn't atomic on
+# network mounts and a partial write's second os.write could interleave with another worker's.
+# A single worker writes LOG_PATH itself
+LOG_WORKERS = int(os.getenv("WEB_CONCURRENCY", "1") or "1")
+LOG_FSYNC_MS = int(os.getenv("LOG_FSYNC_MS", "1000"))
+LOG_QUEUE_MAX = int(os.getenv("LOG_QUEUE_MAX", "10000"))
 SUPABASE_URL = os.getenv("SUPABASE_URL", "")
 SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY", "")
+SB_BATCH_MAX = int(os.getenv("SB_BATCH_MAX", "200"))
+SB_FLUSH_MS = int(os.getenv("SB_FLUSH_MS", "100"))
+SB_QUEUE_MAX = int(os.getenv("SB_QUEUE_MAX", "10000"))
+# batches in flight at once, per worker. 1 keeps a worker's upserts in its own arrival order;
+# above 1 a later batch can land before an earlier one, and under merge-duplicates an older row
+# may then overwrite a newer one with the same conflict key. There is no ordering across
+# workers: each has its own flusher, so with WEB_CONCURRENCY > 1 same-key rows that hit
+# different workers can land in either order whatever this is set to
+SB_MAX_INFLIGHT = int(os.getenv("SB_MAX_INFLIGHT", "1"))
+# upsert conflict key of hp_cme_rsi/hp_cme_cvd, sent as ?on_conflict= so PostgREST merges on the
+# same columns the batches are deduped on (last row wins; a merge-duplicates upsert can't touch the
+# same key twice in one statement). Must name a unique constraint on both tables
+SB_CONFLICT_COLS = tuple(c.strip() for c in os.getenv("SB_CONFLICT_COLS", "ts,symbol,tf").split(",") if c.strip())
 
-app = FastAPI(title="AlphaOps CME RSI + CVD Feed")
-os.makedirs(os.path.dirname(LOG_PATH), exist_ok=True)
-supabase: Optional[Client] = None
-if SUPABASE_URL and SUPABASE_KEY:
-    supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+app = FastAPI(title="AlphaOps CME RSI + CVD Feed", default_response_class=ORJSONResponse)
+SB_ENABLED = bool(SUPABASE_URL and SUPABASE_KEY)
+_SB_REST = f"{SUPABASE_URL}/rest/v1/"
+_SB_ON_CONFLICT = "?on_conflict=" + ",".join(SB_CONFLICT_COLS)
+_SB_HEADERS = {
+    "apikey": SUPABASE_KEY,
+    "Authorization": f"Bearer {SUPABASE_KEY}",
+    "Content-Type": "application/json",
+    "Prefer": "resolution=merge-duplicates,return=minimal",
+}
+_HTTPX: Optional[httpx.AsyncClient] = None
+_LOG_QUEUE: Optional["asyncio.Queue[bytes]"] = None
+_LOG_FD: Optional[int] = None
+_LOG_TASK: Optional[asyncio.Task] = None
+_LOG_DROPPED = 0
+_SB_QUEUE: Optional["asyncio.Queue[Tuple[str, Dict[str, Any]]]"] = None
+_SB_TASK: Optional[asyncio.Task] = None
+_SB_DROPPED = 0
+_SB_INFLIGHT: "set[asyncio.Task]" = set()
+_NOW_ISO = ""
+_CLOCK_TASK: Optional[asyncio.Task] = None
+
+# ───────────────────────────────────────────────
+# Payloads (TradingView alert bodies). Fields stay untyped so anything the old dict.get
+# mapping accepted still decodes; the mappers coerce with as_str/as_float (bad number → 0.0)
+class TvPayload(msgspec.Struct):
+    time: Any = None
+    ex: Any = None
+    sec: Any = None
+    auth: Any = None
+
+class RsiPayload(TvPayload):
+    symbol: Any = None
+    tf: Any = None
+    rsi: Any = None
+    dist_bps: Any = None
+
+class CvdPayload(TvPayload):
+    symbol: Any = None
+    tf: Any = None
+    price: Any = None
+    volume: Any = None
+    delta: Any = None
+    cvd: Any = None
+
+_RSI_DEC = msgspec.json.Decoder(RsiPayload)
+_CVD_DEC = msgspec.json.Decoder(CvdPayload)
+
+def decode_payload(dec: msgspec.json.Decoder, body: bytes):
+    try:
+        # msgspec skips unknown fields without validating them, but the whole body is later
+        # embedded verbatim as msgspec.Raw, so check it is UTF-8 up front
+        body.decode()
+        return dec.decode(body)
+    except (msgspec.DecodeError, UnicodeDecodeError) as e: raise HTTPException(status_code=400, detail=f"Invalid payload: {e}")
 
 # ───────────────────────────────────────────────
 # Helpers
+# TradingView {{timenow}} is already UTC ISO-8601; such strings skip the datetime round-trip
+# (fields are range-checked; day 29-31 is checked against the month below)
+_ISO_UTC_RE = re.compile(
+    r"((?!0000)\d{4})-(0[1-9]|1[0-2])-(0[1-9]|[12]\d|3[01])T([01]\d|2[0-3]):[0-5]\d:[0-5]\d(?:\.\d+)?(Z|\+00:?00)",
+    re.ASCII)
+
 def utc_iso(ts: Optional[str] = None) -> str:
+    if type(ts) is str:
+        m = _ISO_UTC_RE.fullmatch(ts)
+        if m and (ts[8:10] <= "28" or int(ts[8:10]) <= calendar.monthrange(int(m[1]), int(m[2]))[1]):
+            return ts if m.end(5) - m.start(5) == 6 else ts[:m.start(5)] + "+00:00"
     if ts:
         try:
             return datetime.fromisoformat(ts.replace("Z","+00:00")).astimezone(timezone.utc).isoformat()
         except: pass
     return datetime.now(timezone.utc).isoformat()
 
-async def save_line(obj: Dict[str, Any]):
-    async with aiofiles.open(LOG_PATH, "a") as f:
-        await f.write(json.dumps(obj, ensure_ascii=False)+"\n")
+# Shared by the log and the Supabase POST; rows carry the original body as msgspec.Raw
+_JSON_ENC = msgspec.json.Encoder()
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+def log_err(msg: str):
+    print(f"[alphaops] {utc_iso()} {msg}", file=sys.stderr, flush=True)
+
+def save_line(obj: Dict[str, Any]):
+    global _LOG_DROPPED
+    if _LOG_QUEUE is None: return
+    try: _LOG_QUEUE.put_nowait(_JSON_ENC.encode(obj)+b"\n")
+    except asyncio.QueueFull: _LOG_DROPPED += 1
 
 async def discord_post(msg: str):
     if not DISCORD_WEBHOOK: return
-    try:
-        async with httpx.AsyncClient(timeout=5) as client:
-            await client.post(DISCORD_WEBHOOK, json={"content": msg})
+    try: await _HTTPX.post(DISCORD_WEBHOOK, content=_JSON_ENC.encode({"content": msg}), headers=_JSON_HEADERS, timeout=5)
     except: pass
 
-def coerce_float(x): 
-    try: return float(x)
-    except: return 0.0
+# ───────────────────────────────────────────────
+# JSONL log writer (one fd, lines coalesced into a single write, fdatasync throttled)
+_fdatasync = getattr(os, "fdatasync", os.fsync)
 
-def auth_ok(data: Dict[str, Any]) -> bool:
-    if RELAXED_AUTH: return True
-    if not APP_SECRET: return True
-    return str(data.get("sec")) == APP_SECRET or str(data.get("auth")) == APP_SECRET
+def log_open() -> int:
+    flags = os.O_WRONLY | os.O_APPEND | os.O_CREAT
+    if LOG_WORKERS <= 1: return os.open(LOG_PATH, flags, 0o644)
+    # claim the first slot no live worker holds (flock is released when a worker dies), so
+    # restarts reuse the same N files; the pid name is only a fallback while old workers linger
+    root, ext = os.path.splitext(LOG_PATH)
+    for slot in range(LOG_WORKERS):
+        fd = os.open(f"{root}.{slot}{ext}", flags, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return fd
+        except OSError: os.close(fd)
+    return os.open(f"{root}.{os.getpid()}{ext}", flags, 0o644)
+
+def log_write(buf: memoryview) -> Tuple[memoryview, Optional[OSError]]:
+    # returns the unwritten remainder (empty on success) and the error that stopped it, if any
+    try:
+        while buf: buf = buf[os.write(_LOG_FD, buf):]
+    except OSError as e: return buf, e
+    return buf, None
+
+async def log_flusher():
+    # OSErrors (ENOSPC, EIO, a flaky mount) never end the task: the unwritten bytes are kept
+    # and retried with backoff while new lines wait in the bounded queue (overflow is counted)
+    global _LOG_DROPPED
+    loop = asyncio.get_running_loop()
+    interval = LOG_FSYNC_MS/1000
+    last_sync, dirty = loop.time(), False
+    pending, backoff = memoryview(b""), 1.0
+    writing: Optional[asyncio.Future] = None
+    try:
+        while True:
+            if not pending:
+                # kept apart from the write: TimeoutError is an OSError subclass, so one handler
+                # would swallow an ETIMEDOUT from os.write as an idle tick
+                try: batch = [await asyncio.wait_for(_LOG_QUEUE.get(), interval if dirty else None)]
+                except asyncio.TimeoutError: batch = []
+                while batch and not _LOG_QUEUE.empty(): batch.append(_LOG_QUEUE.get_nowait())
+                pending = memoryview(b"".join(batch))
+            if pending:
+                # off the loop so a slow mount stalls only this task, not in-flight requests;
+                # shielded so a cancel can't lose track of how far the thread got
+                writing = asyncio.ensure_future(asyncio.to_thread(log_write, pending))
+                pending, e = await asyncio.shield(writing)
+                writing = None
+                if e is None: dirty, backoff = True, 1.0
+                else:
+                    log_err(f"log write failed, {len(pending)} bytes kept for retry in {backoff:.0f}s: {e!r}")
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff*2, 30.0)
+                    continue
+            if dirty and loop.time() - last_sync >= interval:
+                try:
+                    await asyncio.to_thread(_fdatasync, _LOG_FD)
+                    dirty = False
+                except OSError as e: log_err(f"log fdatasync failed: {e!r}")
+                last_sync = loop.time()
+            if _LOG_DROPPED:
+                log_err(f"log queue full, dropped {_LOG_DROPPED} lines")
+                _LOG_DROPPED = 0
+    except asyncio.CancelledError:
+        if writing is not None: pending, _ = await writing
+        if pending:
+            pending, e = log_write(pending)
+            if e is not None: log_err(f"log write failed on shutdown, {len(pending)} bytes lost: {e!r}")
+        raise
 
 # ───────────────────────────────────────────────
-# Routes
+# Supabase batching (rows are coalesced and upserted per table in one POST)
+def sb_enqueue(table: str, row: Dict[str, Any]):
+    global _SB_DROPPED
+    if _SB_QUEUE is None: return
+    try: _SB_QUEUE.put_nowait((table, row))
+    except asyncio.QueueFull: _SB_DROPPED += 1
 
-@app.get("/health")
-async def health(): return {"ok": True, "ts": utc_iso()}
-
-@app.post("/ingest/test")
-async def ingest_rsi(request: Request):
-    body = await request.body()
-    data = json.loads(body.decode("utf-8","ignore"))
-    if not auth_ok(data): raise HTTPException(status_code=401, detail="Unauthorized")
-
-    row = {
-        "ts": utc_iso(data.get("time")),
-        "symbol": data.get("symbol", "BTCUSD.P"),
-        "tf": data.get("tf", "1m"),
-        "rsi": coerce_float(data.get("rsi")),
-        "dist_bps": coerce_float(data.get("dist_bps")),
-        "exchange": data.get("ex", "CME"),
+_SB_ROW_ERRORS = (400, 409, 422)
+
+def sb_key(row: Dict[str, Any]) -> Tuple[Any, ...]:
+    return tuple(row.get(c) for c in SB_CONFLICT_COLS)
+
+def sb_report(line: Dict[str, Any]):
+    if _LOG_QUEUE is not None: save_line(line)
+    else: log_err(_JSON_ENC.encode(line).decode())
+
+def sb_error(table: str, rows: List[Dict[str, Any]], error: str):
+    sb_report({"sb_error": {"ts": utc_iso(), "table": table, "rows": len(rows), "keys": [sb_key(r) for r in rows], "error": error}})
+
+async def sb_post(table: str, rows: List[Dict[str, Any]]):
+    deduped = list({sb_key(r): r for r in rows}.values())
+    if len(deduped) < len(rows):
+        dupes = {k for k, n in Counter(sb_key(r) for r in rows).items() if n > 1}
+        sb_report({"sb_dedupe": {"ts": utc_iso(), "table": table, "dropped": len(rows) - len(deduped), "keys": list(dupes)}})
+    rows = deduped
+    try:
+        r = await _HTTPX.post(_SB_REST + table + _SB_ON_CONFLICT, headers=_SB_HEADERS, content=_JSON_ENC.encode(rows), timeout=10)
+    except Exception as e:
+        return sb_error(table, rows, repr(e))
+    if r.is_success: return
+    if r.status_code in _SB_ROW_ERRORS and len(rows) > 1:
+        # a bad row rejects the whole statement; retry one by one so it only loses itself
+        # (auth/route errors like 401/403/404 would fail every row, so they're reported once)
+        await asyncio.gather(*(sb_post(table, [row]) for row in rows))
+        return
+    sb_error(table, rows, f"HTTP {r.status_code}: {r.text[:500]}")
+
+def sb_report_dropped():
+    global _SB_DROPPED
+    if not _SB_DROPPED: return
+    sb_report({"sb_dropped": {"ts": utc_iso(), "rows": _SB_DROPPED, "error": "supabase queue full"}})
+    _SB_DROPPED = 0
+
+async def sb_upsert(batch: List[Tuple[str, Dict[str, Any]]]):
+    sb_report_dropped()
+    tables: Dict[str, List[Dict[str, Any]]] = {}
+    for table, row in batch: tables.setdefault(table, []).append(row)
+    await asyncio.gather(*(sb_post(table, rows) for table, rows in tables.items()))
+
+async def sb_flusher():
+    # up to SB_MAX_INFLIGHT batches are posted concurrently over the shared pool (see the
+    # ordering note on SB_MAX_INFLIGHT); with the default of 1 this worker's batches go in order
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(SB_MAX_INFLIGHT)
+    def done(t: asyncio.Task):
+        _SB_INFLIGHT.discard(t)
+        slots.release()
+    while True:
+        batch = [await _SB_QUEUE.get()]
+        try:
+            deadline = loop.time() + SB_FLUSH_MS/1000
+            while len(batch) < SB_BATCH_MAX:
+                remaining = deadline - loop.time()
+                if remaining <= 0: break
+                try: batch.append(await asyncio.wait_for(_SB_QUEUE.get(), remaining))
+                except asyncio.TimeoutError: break
+            await slots.acquire()
+        except asyncio.CancelledError:
+            await sb_upsert(batch)  # shutdown: don't drop rows already taken off the queue
+            raise
+        t = asyncio.create_task(sb_upsert(batch))
+        _SB_INFLIGHT.add(t)
+        t.add_done_callback(done)
+
+AUTH_REQUIRED = bool(APP_SECRET) and not RELAXED_AUTH
+_SECRET_B = APP_SECRET.encode()
+
+def header_auth(request: Request) -> Optional[bool]:
+    # None when no x-alphaops-secret header was sent (TradingView alerts can't set headers),
+    # so the caller falls back to the sec/auth body fields
+    if not AUTH_REQUIRED: return True
+    h = request.headers.get("x-alphaops-secret")
+    return None if h is None else hmac.compare_digest(h.encode(), _SECRET_B)
+
+def auth_ok(p: TvPayload) -> bool:
+    if not AUTH_REQUIRED: return True
+    # constant-time on both fields; `|` so neither compare is skipped
+    return hmac.compare_digest(str(p.sec).encode(), _SECRET_B) | hmac.compare_digest(str(p.auth).encode(), _SECRET_B)
+
+# /health timestamp, refreshed once a second instead of per probe
+async def clock_ticker():
+    global _NOW_ISO
+    while True:
+        _NOW_ISO = utc_iso()
+        await asyncio.sleep(1)
+
+def watch(task: asyncio.Task) -> asyncio.Task:
+    # background loops are meant to run until shutdown; make an unexpected exit visible
+    def done(t: asyncio.Task):
+        if not t.cancelled() and t.exception() is not None:
+            log_err(f"background task {t.get_coro().__name__} crashed: {t.exception()!r}")
+    task.add_done_callback(done)
+    return task
+
+# ───────────────────────────────────────────────
+# Lifecycle
+@app.on_event("startup")
+async def startup():
+    global _HTTPX, _LOG_QUEUE, _LOG_FD, _LOG_TASK, _SB_QUEUE, _SB_TASK, _CLOCK_TASK, _NOW_ISO
+    _NOW_ISO = utc_iso()
+    _CLOCK_TASK = watch(asyncio.create_task(clock_ticker()))
+    if LOG_ENABLED:
+        try: os.makedirs(LOG_DIR, exist_ok=True)
+        except OSError: pass
+        _LOG_FD = log_open()
+        _LOG_QUEUE = asyncio.Queue(maxsize=LOG_QUEUE_MAX)
+        _LOG_TASK = watch(asyncio.create_task(log_flusher()))
+    _HTTPX = httpx.AsyncClient(
+        http2=True,
+        timeout=httpx.Timeout(5.0),
+        limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+    )
+    if not SB_ENABLED: return
+    _SB_QUEUE = asyncio.Queue(maxsize=SB_QUEUE_MAX)
+    _SB_TASK = watch(asyncio.create_task(sb_flusher()))
+
+@app.on_event("shutdown")
+async def shutdown():
+    global _HTTPX, _LOG_QUEUE, _LOG_FD, _LOG_TASK, _LOG_DROPPED, _SB_QUEUE, _SB_TASK, _SB_DROPPED, _CLOCK_TASK
+    if _CLOCK_TASK is not None: _CLOCK_TASK.cancel()
+    if _SB_TASK is not None:
+        _SB_TASK.cancel()
+        await asyncio.gather(_SB_TASK, *_SB_INFLIGHT, return_exceptions=True)
+        pending = []
+        while not _SB_QUEUE.empty(): pending.append(_SB_QUEUE.get_nowait())
+        if pending: await sb_upsert(pending)
+        sb_report_dropped()
+    if _HTTPX is not None: await _HTTPX.aclose()
+    if _LOG_TASK is not None:
+        _LOG_TASK.cancel()
+        await asyncio.gather(_LOG_TASK, return_exceptions=True)
+        pending = []
+        while not _LOG_QUEUE.empty(): pending.append(_LOG_QUEUE.get_nowait())
+        try:
+            rest, e = log_write(memoryview(b"".join(pending)))
+            if e is not None: raise e
+            _fdatasync(_LOG_FD)
+        except OSError as e: log_err(f"log flush failed on shutdown: {e!r}")
+        if _LOG_DROPPED: log_err(f"log queue full, dropped {_LOG_DROPPED} lines")
+        os.close(_LOG_FD)
+    # back to the pre-startup state, so a later startup (e.g. a new TestClient) starts clean
+    _HTTPX = _LOG_QUEUE = _LOG_FD = _LOG_TASK = _SB_QUEUE = _SB_TASK = _CLOCK_TASK = None
+    _LOG_DROPPED = _SB_DROPPED = 0
+
+# ───────────────────────────────────────────────
+# Mappers
+RSI_TMPL = "📊 **CME RSI** {symbol} | TF {tf} | RSI {rsi:.1f}"
+CVD_TMPL = "🧭 **CME CVD** {symbol} | TF {tf} | Δ {delta:.2f} | CVD {cvd:.2f}"
+
+def as_str(x: Any, d: str) -> str:
+    return x if type(x) is str else (d if x is None else str(x))
+
+def as_float(x: Any) -> float:
+    if type(x) is float: return x
+    try: return float(x)
+    except (TypeError, ValueError, OverflowError): return 0.0
+
+def map_rsi(p: RsiPayload, raw: msgspec.Raw) -> Dict[str, Any]:
+    return {
+        "ts": utc_iso(p.time),
+        "symbol": as_str(p.symbol, "BTCUSD.P"),
+        "tf": as_str(p.tf, "1m"),
+        "rsi": as_float(p.rsi),
+        "dist_bps": as_float(p.dist_bps),
+        "exchange": as_str(p.ex, "CME"),
         "source": "tradingview",
-        "payload": data
+        "payload": raw
     }
-    await save_line({"rsi_ingest": row})
-    if supabase: supabase.table("hp_cme_rsi").upsert(row).execute()
-    await discord_post(f"📊 **CME RSI** {row['symbol']} | TF {row['tf']} | RSI {row['rsi']:.1f}")
-    return {"ok": True, "type": "RSI", "ts": row["ts"]}
-
-@app.post("/ingest/cvd")
-async def ingest_cvd(request: Request):
-    body = await request.body()
-    data = json.loads(body.decode("utf-8","ignore"))
-    if not auth_ok(data): raise HTTPException(status_code=401, detail="Unauthorized")
-
-    row = {
-        "ts": utc_iso(data.get("time")),
-        "symbol": data.get("symbol", "BTC1!"),
-        "tf": data.get("tf", "12m"),
-        "price": coerce_float(data.get("price")),
-        "volume": coerce_float(data.get("volume")),
-        "delta": coerce_float(data.get("delta")),
-        "cvd": coerce_float(data.get("cvd")),
-        "exchange": data.get("ex", "CME"),
+
+def map_cvd(p: CvdPayload, raw: msgspec.Raw) -> Dict[str, Any]:
+    return {
+        "ts": utc_iso(p.time),
+        "symbol": as_str(p.symbol, "BTC1!"),
+        "tf": as_str(p.tf, "12m"),
+        "price": as_float(p.price),
+        "volume": as_float(p.volume),
+        "delta": as_float(p.delta),
+        "cvd": as_float(p.cvd),
+        "exchange": as_str(p.ex, "CME"),
         "source": "tradingview",
-        "payload": data
+        "payload": raw
     }
-    await save_line({"cvd_ingest": row})
-    if supabase: supabase.table("hp_cme_cvd").upsert(row).execute()
-    await discord_post(f"🧭 **CME CVD** {row['symbol']} | TF {row['tf']} | Δ {row['delta']:.2f} | CVD {row['cvd']:.2f}")
-    return {"ok": True, "type": "CVD", "ts": row["ts"]}
+
+def ingest_route(path: str, kind: str, dec: msgspec.json.Decoder, mapper, table: str, tmpl: str):
+    log_key = f"{kind.lower()}_ingest"
+    # ts always comes from utc_iso (plain ASCII, nothing to escape), so the reply is spliced from bytes
+    resp_head, resp_tail = b'{"ok":true,"type":"' + kind.encode() + b'","ts":"', b'"}'
+    _decode, _hdr_auth, _auth, _save, _enqueue, _discord = decode_payload, header_auth, auth_ok, save_line, sb_enqueue, discord_post
+
+    async def ingest(request: Request, background_tasks: BackgroundTasks):
+        authed = _hdr_auth(request)
+        if authed is False: raise HTTPException(status_code=401, detail="Unauthorized")
+        body = await request.body()
+        p = _decode(dec, body)
+        if authed is None and not _auth(p): raise HTTPException(status_code=401, detail="Unauthorized")
+        # body already decoded as valid JSON, so CR/LF can only be insignificant whitespace;
+        # dropping them keeps the embedded payload on one JSONL line
+        row = mapper(p, msgspec.Raw(body.translate(None, b"\r\n")))
+        _save({log_key: row})
+        _enqueue(table, row)
+        if DISCORD_WEBHOOK: background_tasks.add_task(_discord, tmpl.format_map(row))
+        return Response(content=resp_head + row["ts"].encode() + resp_tail, media_type="application/json")
+
+    ingest.__name__ = f"ingest_{kind.lower()}"
+    app.post(path)(ingest)
+
+# ───────────────────────────────────────────────
+# Routes
+
+@app.get("/health")
+async def health(): return {"ok": True, "ts": _NOW_ISO or utc_iso()}
+
+ingest_route("/ingest/test", "RSI", _RSI_DEC, map_rsi, "hp_cme_rsi", RSI_TMPL)
+ingest_route("/ingest/cvd", "CVD", _CVD_DEC, map_cvd, "hp_cme_cvd", CVD_TMPL)
@@ -0,0 +1,7 @@
+# Test env: app/app.py reads its config at import, so set it before any test imports it
+import os, tempfile
+
+os.environ.setdefault("LOG_ENABLED", "0")
+os.environ.setdefault("LOG_PATH", os.path.join(tempfile.mkdtemp(), "cme_sandbox.json"))
+for k in ("ALPHAOPS_SECRET", "RELAXED_AUTH", "SUPABASE_URL", "SUPABASE_SERVICE_ROLE_KEY", "DISCORD_WEBHOOK_STATUS"):
+    os.environ.pop(k, None)
@@ -0,0 +1,101 @@
+# test_app.py — auth, timestamp normalisation and payload coercion
+from datetime import datetime, timezone
+import pytest
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+import app.app as m
+
+SECRET = "s3cret"
+
+@pytest.fixture
+def client():
+    with TestClient(m.app) as c: yield c
+
+@pytest.fixture
+def secret(monkeypatch):
+    monkeypatch.setattr(m, "AUTH_REQUIRED", True)
+    monkeypatch.setattr(m, "_SECRET_B", SECRET.encode())
+
+# ───────────────────────────────────────────────
+# Auth
+
+def test_wrong_header_rejected_before_body_is_read(client, secret, monkeypatch):
+    async def body(self): raise AssertionError("body read on a rejected request")
+    monkeypatch.setattr(Request, "body", body)
+    r = client.post("/ingest/test", content=b'{"auth": "s3cret"}', headers={"x-alphaops-secret": "nope"})
+    assert r.status_code == 401
+
+def test_correct_header_ignores_body_secret(client, secret):
+    r = client.post("/ingest/test", content=b'{"auth": "wrong", "sec": "wrong"}', headers={"x-alphaops-secret": SECRET})
+    assert r.status_code == 200
+
+@pytest.mark.parametrize("body,status", [
+    (b'{"sec": "s3cret"}', 200),
+    (b'{"auth": "s3cret"}', 200),
+    (b'{"sec": "wrong", "auth": "s3cret"}', 200),
+    (b'{"sec": "wrong"}', 401),
+    (b'{}', 401),
+])
+def test_no_header_falls_back_to_body_fields(client, secret, body, status):
+    assert client.post("/ingest/cvd", content=body).status_code == status
+
+def test_relaxed_or_empty_secret_allows_all(client, monkeypatch):
+    monkeypatch.setattr(m, "AUTH_REQUIRED", False)
+    assert client.post("/ingest/test", content=b'{}').status_code == 200
+    assert client.post("/ingest/test", content=b'{}', headers={"x-alphaops-secret": "nope"}).status_code == 200
+
+def test_auth_required_only_with_secret_and_not_relaxed(monkeypatch):
+    import importlib
+    monkeypatch.setenv("ALPHAOPS_SECRET", SECRET)
+    monkeypatch.setenv("RELAXED_AUTH", "1")
+    try:
+        assert importlib.reload(m).AUTH_REQUIRED is False
+        monkeypatch.setenv("RELAXED_AUTH", "0")
+        assert importlib.reload(m).AUTH_REQUIRED is True
+        monkeypatch.setenv("ALPHAOPS_SECRET", "")
+        assert importlib.reload(m).AUTH_REQUIRED is False
+    finally:
+        monkeypatch.undo()
+        importlib.reload(m)
+
+# ───────────────────────────────────────────────
+# utc_iso
+
+@pytest.mark.parametrize("ts,out", [
+    ("2024-01-01T00:00:00Z", "2024-01-01T00:00:00+00:00"),
+    ("2024-01-01T00:00:00.123Z", "2024-01-01T00:00:00.123+00:00"),
+    ("2024-01-01T00:00:00+0000", "2024-01-01T00:00:00+00:00"),
+    ("2024-01-01T00:00:00+00:00", "2024-01-01T00:00:00+00:00"),
+    ("2024-02-29T12:00:00Z", "2024-02-29T12:00:00+00:00"),
+    ("2024-01-01T02:00:00+02:00", "2024-01-01T00:00:00+00:00"),
+])
+def test_utc_iso_accepts(ts, out):
+    assert m.utc_iso(ts) == out
+
+@pytest.mark.parametrize("ts", [
+    "2024-02-30T25:61:61Z", "2024-02-30T10:00:00Z", "2023-02-29T10:00:00Z", "2024-04-31T00:00:00Z",
+    "2024-13-01T00:00:00Z", "2024-01-01T24:00:00Z", "2024-01-01T00:60:00Z", "0000-01-01T00:00:00Z",
+    "junk", "", None, 17,
+])
+def test_utc_iso_rejects_to_now(ts):
+    out = datetime.fromisoformat(m.utc_iso(ts))
+    assert abs((datetime.now(timezone.utc) - out).total_seconds()) < 5
+
+# ───────────────────────────────────────────────
+# Payload coercion
+
+@pytest.mark.parametrize("body", [
+    b'{"tf": 5}', b'{"symbol": null}', b'{"rsi": ""}', b'{"rsi": "abc"}',
+    b'{"rsi": 1' + b"0" * 400 + b'}',
+])
+def test_loose_bodies_still_ingest(client, body):
+    assert client.post("/ingest/test", content=body).status_code == 200
+
+def test_map_rsi_coerces():
+    p = m._RSI_DEC.decode(b'{"tf": 5, "symbol": null, "rsi": "12.5", "dist_bps": "x"}')
+    row = m.map_rsi(p, m.msgspec.Raw(b"{}"))
+    assert (row["symbol"], row["tf"], row["rsi"], row["dist_bps"], row["exchange"]) == ("BTCUSD.P", "5", 12.5, 0.0, "CME")
+
+@pytest.mark.parametrize("body", [b"nope", b"[1]", b'{"symbol": "a\xff"}', b'{"x": "a\xff"}'])
+def test_undecodable_body_is_400(client, body):
+    assert client.post("/ingest/test", content=body).status_code == 400
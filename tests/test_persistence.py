@@ -0,0 +1,158 @@
+# test_persistence.py — JSONL log flusher, Supabase batching and the ingest reply/payload bytes
+import asyncio, errno, json
+import httpx, pytest
+from fastapi.testclient import TestClient
+import app.app as m
+
+@pytest.fixture
+def log_path(tmp_path, monkeypatch):
+    path = tmp_path / "cme_sandbox.json"
+    monkeypatch.setattr(m, "LOG_ENABLED", True)
+    monkeypatch.setattr(m, "LOG_PATH", str(path))
+    monkeypatch.setattr(m, "LOG_DIR", str(tmp_path))
+    monkeypatch.setattr(m, "LOG_WORKERS", 1)
+    monkeypatch.setattr(m, "LOG_FSYNC_MS", 10)
+    return path
+
+@pytest.fixture
+def sb(monkeypatch):
+    # Supabase on, every POST recorded and answered by `sb.respond(rows) -> status`
+    class Sb:
+        calls = []
+        respond = staticmethod(lambda rows: 201)
+        def handler(self, req):
+            rows = json.loads(req.content)
+            self.calls.append((req.url.path, dict(req.url.params), rows))
+            return httpx.Response(self.respond(rows), text="err")
+    s = Sb()
+    s.calls = []
+    monkeypatch.setattr(m, "SB_ENABLED", True)
+    monkeypatch.setattr(m, "_SB_REST", "http://sb.test/rest/v1/")
+    monkeypatch.setattr(m, "SB_FLUSH_MS", 20)
+    return s
+
+async def start(sb=None):
+    await m.startup()
+    if sb is not None:
+        await m._HTTPX.aclose()
+        m._HTTPX = httpx.AsyncClient(transport=httpx.MockTransport(sb.handler))
+
+def read_log(path):
+    return [json.loads(l) for l in path.read_bytes().splitlines()]
+
+def row(ts, rsi, **kw):
+    return dict({"ts": ts, "symbol": "X", "tf": "1m", "rsi": rsi}, **kw)
+
+# ───────────────────────────────────────────────
+# Log flusher
+
+def test_log_lines_drained_on_shutdown(log_path):
+    async def run():
+        await start()
+        for i in range(5): m.save_line({"i": i})
+        await m.shutdown()
+    asyncio.run(run())
+    assert read_log(log_path) == [{"i": i} for i in range(5)]
+
+def test_log_write_errors_are_retried_not_fatal(log_path, monkeypatch, capsys):
+    real, errors = m.log_write, [errno.ETIMEDOUT, errno.ENOSPC]
+    def flaky(buf):
+        if errors: return buf, OSError(errors.pop(0), "boom")
+        return real(buf)
+    monkeypatch.setattr(m, "log_write", flaky)
+    async def run():
+        await start()
+        m.save_line({"i": 0})
+        while errors: await asyncio.sleep(0.05)
+        assert not m._LOG_TASK.done()
+        m.save_line({"i": 1})
+        await asyncio.sleep(0.05)
+        await m.shutdown()
+    asyncio.run(run())
+    assert read_log(log_path) == [{"i": 0}, {"i": 1}]
+    err = capsys.readouterr().err
+    assert "TimeoutError" in err and "kept for retry" in err
+
+def test_log_queue_overflow_is_counted(log_path, monkeypatch, capsys):
+    monkeypatch.setattr(m, "LOG_QUEUE_MAX", 2)
+    async def run():
+        await start()
+        for i in range(5): m.save_line({"i": i})
+        assert m._LOG_DROPPED == 3
+        await m.shutdown()
+    asyncio.run(run())
+    assert read_log(log_path) == [{"i": 0}, {"i": 1}]
+    assert "dropped 3 lines" in capsys.readouterr().err
+
+# ───────────────────────────────────────────────
+# Supabase batching
+
+def test_batch_deduped_on_conflict_key(log_path, sb):
+    async def run():
+        await start(sb)
+        await m.sb_post("hp_cme_rsi", [row("t1", 1), row("t1", 2), row("t2", 3)])
+        await m.shutdown()
+    asyncio.run(run())
+    (path, params, rows), = sb.calls
+    assert path == "/rest/v1/hp_cme_rsi" and params == {"on_conflict": "ts,symbol,tf"}
+    assert [r["rsi"] for r in rows] == [2, 3]
+    dedupe, = [l["sb_dedupe"] for l in read_log(log_path) if "sb_dedupe" in l]
+    assert dedupe["dropped"] == 1 and dedupe["keys"] == [["t1", "X", "1m"]]
+
+def test_row_level_4xx_retries_rows_one_by_one(log_path, sb):
+    sb.respond = lambda rows: 400 if any(r["rsi"] == 13 for r in rows) else 201
+    async def run():
+        await start(sb)
+        await m.sb_post("hp_cme_rsi", [row("t1", 1), row("t2", 13), row("t3", 3)])
+        await m.shutdown()
+    asyncio.run(run())
+    assert len(sb.calls) == 4
+    err, = [l["sb_error"] for l in read_log(log_path) if "sb_error" in l]
+    assert err["keys"] == [["t2", "X", "1m"]] and err["error"].startswith("HTTP 400")
+
+@pytest.mark.parametrize("status", [401, 403, 404, 500])
+def test_non_row_errors_reported_once(log_path, sb, status):
+    sb.respond = lambda rows: status
+    async def run():
+        await start(sb)
+        await m.sb_post("hp_cme_rsi", [row(f"t{i}", i) for i in range(10)])
+        await m.shutdown()
+    asyncio.run(run())
+    assert len(sb.calls) == 1
+    err, = [l["sb_error"] for l in read_log(log_path) if "sb_error" in l]
+    assert err["rows"] == 10
+
+def test_rows_queued_or_collecting_are_flushed_on_shutdown(log_path, sb, monkeypatch):
+    monkeypatch.setattr(m, "SB_FLUSH_MS", 60_000)  # the flusher is mid-collection when cancelled
+    async def run():
+        await start(sb)
+        for i in range(3): m.sb_enqueue("hp_cme_rsi", row(f"t{i}", i))
+        await asyncio.sleep(0.05)
+        await m.shutdown()
+    asyncio.run(run())
+    assert sorted(r["rsi"] for _, _, rows in sb.calls for r in rows) == [0, 1, 2]
+
+# ───────────────────────────────────────────────
+# Ingest reply and payload bytes
+
+def test_reply_is_spliced_json(log_path):
+    with TestClient(m.app) as c:
+        r = c.post("/ingest/test", content=b'{"time": "2024-01-01T00:00:00Z"}')
+    assert r.headers["content-type"] == "application/json"
+    assert r.content == b'{"ok":true,"type":"RSI","ts":"2024-01-01T00:00:00+00:00"}'
+
+def test_raw_payload_has_crlf_stripped_and_reaches_log_and_supabase(log_path, sb):
+    body = b'{\r\n  "symbol": "ES1!",\n  "rsi": 40,\n  "note": "a b"\r\n}\n'
+    with TestClient(m.app) as c:
+        c.portal.call(swap_client, sb)
+        assert c.post("/ingest/test", content=body).status_code == 200
+    raw = log_path.read_bytes()
+    assert raw.count(b"\n") == 1 and b"\r" not in raw
+    line, = read_log(log_path)
+    assert line["rsi_ingest"]["payload"] == json.loads(body)
+    (_, _, rows), = sb.calls
+    assert rows[0]["payload"] == json.loads(body)
+
+async def swap_client(sb):
+    await m._HTTPX.aclose()
+    m._HTTPX = httpx.AsyncClient(transport=httpx.MockTransport(sb.handler))